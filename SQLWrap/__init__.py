@@ -1,3 +1,5 @@
 from .constants import data_path
 from .query import *
-from .database import *
\ No newline at end of file
+from .database import *
+from .maintenance import *
+from .materialized import *
\ No newline at end of file
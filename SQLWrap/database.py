@@ -1,5 +1,7 @@
+import asyncio
 import logging
 import sqlite3
+import time
 import traceback
 import asqlite
 import typing as t
@@ -17,9 +19,21 @@ class Column:
         self.specialities = specialities
 
 class Table:
-    def __init__(self, table_name, primary_key_columns: t.Union[t.List, t.Any], *, columns: t.List[Column], database: str=None, auto_increment=False):
-        """Unique key columns must be type of integer."""
+    def __init__(self, table_name, primary_key_columns: t.Union[t.List, t.Any], *, columns: t.List[Column], database: str=None, auto_increment=False,
+                 expiry_column: str=None, ttl: float=None):
+        """
+            Unique key columns must be type of integer.
+            'expiry_column' holds a unix timestamp. A row is expired when it is older than 'ttl' seconds, or when it is in the past if 'ttl' is not given.
+            Rows with NULL in 'expiry_column' never expire. If 'ttl' is given the column is filled with the current time on insert.
+        """
         self.table = table_name
+        self.maintenance = None
+        self.expiry_column = expiry_column
+        self.ttl = ttl
+        self._purger: t.Optional[asyncio.Task] = None
+
+        if expiry_column and expiry_column not in [x.name for x in columns]:
+            columns = columns + [Column(expiry_column, "REAL")]
 
         if not isinstance(primary_key_columns, list):
             primary_key_columns = [primary_key_columns]
@@ -60,6 +74,10 @@ class Table:
                 curr_columns = [x[1] for x in curr_columns]
                 if (not column.name in curr_columns):
                     self._add_column(column.name, column.type, column.specialities)
+
+            if self.expiry_column:
+                cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{self.table.strip("[]")}_{self.expiry_column} ON {self.table} ({self.expiry_column})')
+                conn.commit()
                     
             conn.close()
             
@@ -117,13 +135,20 @@ class Table:
         async with asqlite.connect(self.database_path, detect_types=constants.detect_types) as conn:
             async with conn.cursor() as cursor:
                 await cursor.execute(*update_query.get_query())
+                self._record_write(cursor.get_cursor().rowcount)
 
             await conn.commit()
 
-    async def _insert(self, insert_query: query.InsertQuery):
+    async def _insert(self, insert_query: query.InsertQuery, delete_query: query.DeleteQuery=None):
+        """'delete_query' runs first in the same transaction."""
         async with asqlite.connect(self.database_path, detect_types=constants.detect_types) as conn:
             async with conn.cursor() as cursor:
+                if delete_query:
+                    await cursor.execute(*delete_query.get_query())
+                    self._record_write(cursor.get_cursor().rowcount)
+
                 await cursor.execute(*insert_query.get_query())
+                self._record_write(cursor.get_cursor().rowcount)
                 
             await conn.commit()
 
@@ -131,9 +156,30 @@ class Table:
         async with asqlite.connect(self.database_path, detect_types=constants.detect_types) as conn:
             async with conn.cursor() as cursor:
                 await cursor.execute(*delete_query.get_query())
+                self._record_write(cursor.get_cursor().rowcount)
 
             await conn.commit()
     
+    def _record_write(self, count):
+        if self.maintenance and count > 0:
+            self.maintenance.record_write(count)
+
+    def _expiry_cutoff(self):
+        return time.time() - (self.ttl or 0)
+
+    def _filter_expired(self, select_query: query.SelectQuery) -> query.SelectQuery:
+        """Returns a copy of the query that skips expired rows, the given query is not changed."""
+        if not self.expiry_column:
+            return select_query
+
+        table = select_query.alias if select_query.alias and select_query.table == self.table else self.table
+        column = f'{table}.{self.expiry_column}'
+        return select_query.copy()._add_raw_where(f'{column} IS NULL OR {column} > ?', (self._expiry_cutoff(),), wrap_existing=True)
+
+    def _set_default_expiry(self, set_query: query.InsertQuery):
+        if self.ttl and not getattr(set_query, "_copyFrom", None) and self.expiry_column not in set_query.get_values():
+            set_query.set_values(**{self.expiry_column: time.time()})
+
     async def get_column_list(self) -> t.List[str]:
         return await self._get_columns()
 
@@ -153,41 +199,56 @@ class Table:
             data = await self.get_with(primary_key)
         return data
 
-    async def get_with(self, primary_key, select_query: query.SelectQuery=None) -> t.Optional[sqlite3.Row]:
+    async def get_with(self, primary_key, select_query: query.SelectQuery=None, include_expired=False) -> t.Optional[sqlite3.Row]:
         primary_key = await self._check_primary_key(primary_key)
 
         if not select_query:
             select_query = query.SelectQuery()
 
-        for k, v in zip(self.primary_keys, primary_key):
-            if not select_query.check_where(k,v):
-                select_query.add_where(equals={k:v})
-
         if not select_query.table:
             select_query.table = self.table
+
+        # With joins the primary key columns could be ambiguous, so they are qualified.
+        table = select_query.alias or select_query.table
+        for k, v in zip(self.primary_keys, primary_key):
+            column = f'{table}.{k}' if select_query._joins else k
+            if not (select_query.check_where(column, v) or select_query.check_where(f'{table}.{k}', v)):
+                select_query.add_where(equals={column:v})
                 
         select_query.set_limit(1)
 
+        if not include_expired:
+            select_query = self._filter_expired(select_query)
+
         result_row = await self._get(select_query)
         return result_row[0] if len(result_row) != 0 else None
 
-    async def get_one(self, select_query: query.SelectQuery) -> sqlite3.Row:
+    async def get_one(self, select_query: query.SelectQuery, include_expired=False) -> sqlite3.Row:
         select_query.set_limit(1)
-        result = await self.get(select_query)
+        result = await self.get(select_query, include_expired=include_expired)
         return result[0] if result else None
         
-    async def get(self, select_query: query.SelectQuery) -> t.List[sqlite3.Row]:
+    async def get(self, select_query: query.SelectQuery, include_expired=False) -> t.List[sqlite3.Row]:
         if not select_query.table:
             select_query.table = self.table
 
+        if not include_expired:
+            select_query = self._filter_expired(select_query)
+
         return await self._get(select_query)
 
-    async def get_column(self, column_name) -> t.List[t.Any]:
-        column_rows = await self._get(query.SelectQuery(table=self.table, columns=[column_name]))
+    async def get_column(self, column_name, include_expired=False) -> t.List[t.Any]:
+        select_query = query.SelectQuery(table=self.table, columns=[column_name])
+        if not include_expired:
+            select_query = self._filter_expired(select_query)
+        column_rows = await self._get(select_query)
         return [x[0] for x in column_rows]
 
-    async def get_all(self) -> t.List[sqlite3.Row]:
-        return await self._get(query.SelectQuery(table=self.table))
+    async def get_all(self, include_expired=False) -> t.List[sqlite3.Row]:
+        select_query = query.SelectQuery(table=self.table)
+        if not include_expired:
+            select_query = self._filter_expired(select_query)
+        return await self._get(select_query)
 
     async def set(self, primary_key=None, set_query: query.SetQuery=None):
         if not set_query:
@@ -201,6 +262,7 @@ class Table:
             if isinstance(set_query, query.InsertQuery):
                 if isinstance(set_query, query.SetQuery):
                     set_query = set_query.get_insert_query()
+                self._set_default_expiry(set_query)
                 await self._insert(set_query)
                 
             elif isinstance(set_query, query.UpdateQuery):
@@ -219,6 +281,15 @@ class Table:
             return await self._update(set_query)
 
         else:
+            delete_query = None
+            if self.expiry_column:
+                # An expired row is replaced as if it was never there. The delete only matches it while it is
+                # still expired and runs in the insert's transaction, so a concurrent refresh isn't overwritten.
+                delete_query = query.DeleteQuery(table=self.table)
+                for k, v in zip(self.primary_keys, primary_key):
+                    delete_query.add_where(equals={k:v})
+                delete_query.add_where(lessOrEquals={self.expiry_column: self._expiry_cutoff()})
+
             values = set_query.get_values()
             for k, v in zip(self.primary_keys, primary_key):
                 if k not in values:
@@ -226,7 +297,8 @@ class Table:
 
             if isinstance(set_query, query.SetQuery):
                 set_query = set_query.get_insert_query()
-            return await self._insert(set_query)
+            self._set_default_expiry(set_query)
+            return await self._insert(set_query, delete_query)
 
     async def delete(self, delete_query: query.DeleteQuery):
         """All entries according to information will be deleted."""
@@ -235,6 +307,64 @@ class Table:
 
         return await self._delete(delete_query)
 
+    async def purge_expired(self, batch_size: int=500, pause: float=0.01, max_batches: int=None) -> int:
+        """
+            Deletes expired rows in batches of 'batch_size', each in its own transaction, sleeping 'pause' seconds between them.
+            Returns the number of deleted rows.
+        """
+        assert self.expiry_column, "Table has no expiry column."
+        command = (f'DELETE FROM {self.table} WHERE rowid IN '
+                   f'(SELECT rowid FROM {self.table} WHERE {self.expiry_column} <= ? LIMIT ?)')
+
+        deleted = 0
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            async with asqlite.connect(self.database_path, detect_types=constants.detect_types) as conn:
+                async with conn.cursor() as cursor:
+                    await cursor.execute(command, (self._expiry_cutoff(), batch_size))
+                    count = cursor.get_cursor().rowcount
+
+                await conn.commit()
+
+            batches += 1
+            if count <= 0:
+                break
+
+            deleted += count
+            self._record_write(count)
+            if count < batch_size:
+                break
+
+            await asyncio.sleep(pause)
+
+        return deleted
+
+    def start_purger(self, interval: float=60.0, batch_size: int=500, pause: float=0.01) -> asyncio.Task:
+        """Starts purging expired rows every 'interval' seconds on the running event loop."""
+        async def run():
+            while True:
+                try:
+                    await self.purge_expired(batch_size=batch_size, pause=pause)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as er:
+                    logging.exception(er)
+
+                await asyncio.sleep(interval)
+
+        if not self._purger or self._purger.done():
+            self._purger = asyncio.get_running_loop().create_task(run())
+        return self._purger
+
+    async def stop_purger(self):
+        if self._purger and not self._purger.done():
+            self._purger.cancel()
+            try:
+                await self._purger
+            except asyncio.CancelledError:
+                pass
+        self._purger = None
+
     async def copy_to_table_on_another_db(self, db_name: str, target_table_name: str):
         async with asqlite.connect(self.database_path, detect_types=constants.detect_types) as conn:
             async with conn.cursor() as cursor:
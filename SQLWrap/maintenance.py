@@ -0,0 +1,238 @@
+import asyncio
+import logging
+import sqlite3
+import time
+import asqlite
+import typing as t
+
+from . import constants
+from .datapath import get_datafile_path
+
+class MaintenanceReport:
+    def __init__(self, step: str, pages_reclaimed: int=0, seconds: float=0.0, result=None) -> None:
+        self.step = step
+        self.pages_reclaimed = pages_reclaimed
+        self.seconds = seconds
+        self.result = result
+
+    def __repr__(self) -> str:
+        return f"<MaintenanceReport step={self.step} pages_reclaimed={self.pages_reclaimed} seconds={self.seconds:.4f} result={self.result}>"
+
+class Maintenance:
+    def __init__(self, database: str=None, *, optimize_after_writes: int=1000, analysis_limit: int=400, analyze_budget: float=0.5,
+                 vacuum_pages: int=64, vacuum_budget: float=0.05, idle_seconds: float=5.0,
+                 check_interval: float=3600.0, check_budget: float=1.0, poll_interval: float=1.0,
+                 on_report: t.Callable[[MaintenanceReport], t.Any]=None):
+        """
+            Opt-in background maintenance for a database file.
+
+            'optimize_after_writes' is the number of recorded writes that triggers 'PRAGMA optimize'.
+            'analysis_limit' bounds the rows ANALYZE looks at per index so it stays short.
+            'analyze_budget' is the seconds 'optimize'/'analyze' may run before they are interrupted and rolled back.
+            An interrupted run halves 'analysis_limit', down to 50, and waits for another 'optimize_after_writes' writes before retrying.
+            'vacuum_pages' is the number of pages freed per 'incremental_vacuum' step.
+            'vacuum_budget' is the total seconds a single vacuum run may spend holding the write lock.
+            'idle_seconds' is how long there must be no writes before vacuuming.
+            'check_interval' is the seconds between 'quick_check' runs. None disables it.
+            'check_budget' is the seconds 'quick_check' may hold its read lock before it is interrupted.
+            'on_report' is called with a MaintenanceReport after each step.
+        """
+        if not database:
+            database = constants.database_name
+        assert database, "Database name is not specified. Specify it with SQLWrap.database_name or at constructor."
+        self.database_path = get_datafile_path(database)
+
+        self.optimize_after_writes = optimize_after_writes
+        self.analysis_limit = analysis_limit
+        self.analyze_budget = analyze_budget
+        self.vacuum_pages = vacuum_pages
+        self.vacuum_budget = vacuum_budget
+        self.idle_seconds = idle_seconds
+        self.check_interval = check_interval
+        self.check_budget = check_budget
+        self.poll_interval = poll_interval
+        self.on_report = on_report
+
+        self._writes_since_optimize = 0
+        self._last_write = time.monotonic()
+        self._last_check = time.monotonic()
+        self._vacuumed_since_write = False
+        self._task: t.Optional[asyncio.Task] = None
+
+    def attach(self, *tables):
+        """Makes the tables report their writes to this maintenance."""
+        for table in tables:
+            table.maintenance = self
+        return self
+
+    def record_write(self, count: int=1):
+        self._writes_since_optimize += count
+        self._last_write = time.monotonic()
+        self._vacuumed_since_write = False
+
+    def start(self) -> asyncio.Task:
+        """Starts the maintenance loop on the running event loop."""
+        if not self._task or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return self._task
+
+    async def stop(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_pending()
+            except asyncio.CancelledError:
+                raise
+            except Exception as er:
+                logging.exception(er)
+
+            await asyncio.sleep(self.poll_interval)
+
+    async def run_pending(self) -> t.List[MaintenanceReport]:
+        """Runs every step that is due right now and returns their reports."""
+        reports = []
+        now = time.monotonic()
+
+        if self.optimize_after_writes and self._writes_since_optimize >= self.optimize_after_writes:
+            reports.append(await self.optimize())
+
+        if self.vacuum_pages and not self._vacuumed_since_write and now - self._last_write >= self.idle_seconds:
+            reports.append(await self.incremental_vacuum())
+
+        if self.check_interval is not None and now - self._last_check >= self.check_interval:
+            reports.append(await self.quick_check())
+
+        return reports
+
+    def _report(self, report: MaintenanceReport) -> MaintenanceReport:
+        logging.info(report)
+        if self.on_report:
+            self.on_report(report)
+        return report
+
+    async def optimize(self) -> MaintenanceReport:
+        """Runs 'PRAGMA optimize' which only re-analyzes tables whose statistics are stale."""
+        return await self._run_analysis("optimize", 'PRAGMA optimize')
+
+    async def analyze(self) -> MaintenanceReport:
+        """Runs a bounded ANALYZE on the whole database."""
+        return await self._run_analysis("analyze", 'ANALYZE')
+
+    def _get_deadline_init(self, start: float, budget: float):
+        """Returns an 'init' for asqlite.connect that interrupts statements running longer than 'budget' seconds."""
+        deadline = start + budget if budget else None
+
+        def init(conn: sqlite3.Connection):
+            if deadline:
+                # Returning true from the progress handler interrupts the running statement.
+                conn.set_progress_handler(lambda: time.perf_counter() > deadline, 1000)
+
+        return init
+
+    async def _run_analysis(self, step: str, command: str) -> MaintenanceReport:
+        start = time.perf_counter()
+        init = self._get_deadline_init(start, self.analyze_budget)
+
+        result = "ok"
+        try:
+            async with asqlite.connect(self.database_path, init=init, detect_types=constants.detect_types) as conn:
+                async with conn.cursor() as cursor:
+                    await cursor.execute(f'PRAGMA analysis_limit={int(self.analysis_limit)}')
+                    await cursor.execute(command)
+                    await cursor.fetchall()
+
+                await conn.commit()
+
+            self._writes_since_optimize = 0
+
+        except sqlite3.OperationalError as er:
+            if "interrupted" not in str(er):
+                raise
+            # Waits for more writes instead of retrying on every poll.
+            self._writes_since_optimize = 0
+            if self.analysis_limit and self.analysis_limit <= 50:
+                result = "interrupted, analysis_limit is at its minimum"
+            else:
+                result = "interrupted"
+                self.analysis_limit = max(self.analysis_limit // 2, 50)
+
+        return self._report(MaintenanceReport(step, seconds=time.perf_counter() - start, result=result))
+
+    async def enable_incremental_vacuum(self) -> MaintenanceReport:
+        """
+            Switches the database to 'auto_vacuum=INCREMENTAL'.
+            On a database that already has tables this needs one full VACUUM, so call it when the database is not busy.
+        """
+        start = time.perf_counter()
+        async with asqlite.connect(self.database_path, detect_types=constants.detect_types) as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute('PRAGMA auto_vacuum')
+                mode = (await cursor.fetchone())[0]
+                if mode != 2:
+                    await cursor.execute('PRAGMA auto_vacuum=INCREMENTAL')
+                    await cursor.execute('VACUUM')
+
+        return self._report(MaintenanceReport("enable_incremental_vacuum", seconds=time.perf_counter() - start))
+
+    async def incremental_vacuum(self) -> MaintenanceReport:
+        """
+            Frees pages in steps of 'vacuum_pages' until the freelist is empty or 'vacuum_budget' seconds are spent.
+            Each step is its own transaction so the write lock is released between them.
+            Does nothing unless the database uses 'auto_vacuum=INCREMENTAL'.
+        """
+        start = time.perf_counter()
+        reclaimed = 0
+        async with asqlite.connect(self.database_path, detect_types=constants.detect_types) as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute('PRAGMA auto_vacuum')
+                if (await cursor.fetchone())[0] == 2:
+                    await cursor.execute('PRAGMA freelist_count')
+                    free_pages = (await cursor.fetchone())[0]
+
+                    while free_pages > 0 and time.perf_counter() - start < self.vacuum_budget:
+                        # incremental_vacuum frees a single page per step with execute, executescript runs it to the end.
+                        await cursor.executescript(f'PRAGMA incremental_vacuum({int(self.vacuum_pages)});')
+                        await cursor.execute('PRAGMA freelist_count')
+                        remaining = (await cursor.fetchone())[0]
+                        if remaining >= free_pages:
+                            break
+                        reclaimed += free_pages - remaining
+                        free_pages = remaining
+
+                    if free_pages == 0:
+                        self._vacuumed_since_write = True
+                else:
+                    self._vacuumed_since_write = True
+
+        return self._report(MaintenanceReport("incremental_vacuum", pages_reclaimed=reclaimed, seconds=time.perf_counter() - start))
+
+    async def quick_check(self) -> MaintenanceReport:
+        """
+            Runs 'PRAGMA quick_check'. The result is a list of problems, or ["ok"].
+            It is "interrupted" if the check took longer than 'check_budget' seconds.
+        """
+        start = time.perf_counter()
+        init = self._get_deadline_init(start, self.check_budget)
+        try:
+            async with asqlite.connect(self.database_path, init=init, detect_types=constants.detect_types) as conn:
+                async with conn.cursor() as cursor:
+                    await cursor.execute('PRAGMA quick_check')
+                    result = [x[0] for x in await cursor.fetchall()]
+
+        except sqlite3.OperationalError as er:
+            if "interrupted" not in str(er):
+                raise
+            result = "interrupted"
+
+        self._last_check = time.monotonic()
+        if result not in (["ok"], "interrupted"):
+            logging.error(f"quick_check failed for {self.database_path}: {result}")
+        return self._report(MaintenanceReport("quick_check", seconds=time.perf_counter() - start, result=result))
@@ -0,0 +1,220 @@
+import logging
+import re
+import sqlite3
+import asqlite
+import typing as t
+
+from . import query, constants
+from .database import Table
+from .datapath import get_datafile_path
+
+class Count:
+    def __init__(self, column: str=None) -> None:
+        """Counts the rows, or the non NULL values of 'column'."""
+        self.column = column
+
+    def get_expression(self):
+        return f'COUNT({self.column if self.column else "*"})'
+
+    def get_type(self, source_columns: t.Dict[str, str]):
+        return "INTEGER"
+
+class Sum:
+    def __init__(self, column: str) -> None:
+        """Sums 'column'. Groups with only NULL values give 0."""
+        self.column = column
+
+    def get_expression(self):
+        return f'COALESCE(SUM({self.column}), 0)'
+
+    def get_type(self, source_columns: t.Dict[str, str]):
+        """The declared type of the summed column, or no type if it is an expression."""
+        return source_columns.get(self.column.split(".")[-1], "")
+
+def _to_literal(value):
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+class MaterializedView:
+    def __init__(self, name: str, select_query: query.SelectQuery, *, aggregates: t.Dict[str, t.Union[Count, Sum]], database: str=None):
+        """
+            Keeps the grouped aggregates of 'select_query' in the table 'name', updated by triggers on the source table.
+            'select_query' gives the source table, its alias, the GROUP BY columns and optionally a WHERE filter. Joins are not supported.
+            'aggregates' is a dictionary of {column_name: Count() or Sum(column)}. Only counts and sums can be kept incrementally.
+            Group columns should not be NULL, NULL groups can't be matched by the primary key.
+            The view is rebuilt when it is created or its definition has changed.
+        """
+        assert select_query.table, "Source table of the select query is not specified."
+        assert select_query._group_by, "Select query has no GROUP BY columns."
+        assert not select_query._joins and not select_query._natural_join_with_table, "Joins are not supported."
+        assert aggregates, "No aggregates are specified."
+
+        if not database:
+            database = constants.database_name
+        assert database, "Database name is not specified. Specify it with SQLWrap.database_name or at constructor."
+
+        self.name = name
+        self.source = select_query.table
+        self.alias = select_query.alias
+        self.group_by = list(select_query._group_by)
+        self.aggregates = aggregates
+        self.database_path = get_datafile_path(database)
+
+        # Triggers can't take parameters, so the filter is inlined. It is done in one pass so a '?' inside a literal stays as it is.
+        parts = select_query._where.split("?")
+        assert len(parts) == len(select_query._where_params) + 1, "Filter placeholders don't match its parameters."
+        self._where = parts[0] + "".join([_to_literal(param) + part for param, part in zip(select_query._where_params, parts[1:])])
+        if not self._where:
+            self._where = "1"
+
+        self._key_columns = [x.split(".")[-1] for x in self.group_by]
+        self._value_columns = list(aggregates.keys()) + ["_count"]
+
+        self._create_view()
+        self.table = Table(name, self._key_columns, columns=[], database=database)
+
+    def _source_table(self):
+        return f'{self.source} AS {self.alias}' if self.alias else self.source
+
+    def _aggregate_select(self, source, sign=""):
+        keys = [f'{x} AS {k}' for x, k in zip(self.group_by, self._key_columns)]
+        expressions = [f'{sign}{x.get_expression()} AS {k}' for k, x in self.aggregates.items()] + [f'{sign}COUNT(*) AS _count']
+        group = ", ".join(self.group_by)
+        return f'SELECT {", ".join(keys + expressions)} FROM {source} WHERE {self._where} GROUP BY {group}'
+
+    def _upsert(self, source, sign=""):
+        columns = ", ".join(self._key_columns + self._value_columns)
+        updates = ", ".join([f'{x}={x}+excluded.{x}' for x in self._value_columns])
+        return (f'INSERT INTO {self.name} ({columns}) {self._aggregate_select(source, sign)} '
+                f'ON CONFLICT ({", ".join(self._key_columns)}) DO UPDATE SET {updates}')
+
+    def _row_source(self, source_columns, row):
+        """A one row table with the columns of 'row' (NEW or OLD), named like the source table or its alias."""
+        return f'(SELECT {", ".join([f"{row}.{x} AS {x}" for x in source_columns])}) AS {self.alias or self.source}'
+
+    def _get_triggers(self, source_columns):
+        new_rows = self._row_source(source_columns, "NEW")
+        old_rows = self._row_source(source_columns, "OLD")
+        # Only the group of the removed row can become empty, so the cleanup is a primary key lookup.
+        keys = ", ".join(self._key_columns)
+        cleanup = (f'DELETE FROM {self.name} WHERE ({keys}) IN (SELECT {", ".join(self.group_by)} FROM {old_rows}) '
+                   f'AND _count<=0;')
+
+        # Updates of columns the view doesn't use can't change it, so the update trigger skips them.
+        used = " ".join(self.group_by + [x.get_expression() for x in self.aggregates.values()] + [self._where])
+        update_of = [x for x in source_columns if re.search(rf'(?<!\w){re.escape(x)}(?!\w)', used)]
+        on_update = f'AFTER UPDATE OF {", ".join(update_of)}' if update_of else 'AFTER UPDATE'
+        return {
+            f'{self.name}_after_insert': f'CREATE TRIGGER {self.name}_after_insert AFTER INSERT ON {self.source} BEGIN '
+                                         f'{self._upsert(new_rows)}; END',
+            f'{self.name}_after_delete': f'CREATE TRIGGER {self.name}_after_delete AFTER DELETE ON {self.source} BEGIN '
+                                         f'{self._upsert(old_rows, "-")}; {cleanup} END',
+            f'{self.name}_after_update': f'CREATE TRIGGER {self.name}_after_update {on_update} ON {self.source} BEGIN '
+                                         f'{self._upsert(old_rows, "-")}; {self._upsert(new_rows)}; {cleanup} END',
+        }
+
+    def _create_view(self):
+        """Creates the table and triggers in one transaction, so a failure leaves the source table as it was."""
+        conn = sqlite3.connect(self.database_path, detect_types=constants.detect_types, isolation_level=None)
+        try:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute(f'''PRAGMA table_info("{self.source.strip("[]")}")''')
+            source_columns = {x[1]: x[2] for x in cursor.fetchall()}
+            assert source_columns, f"Source table {self.source} does not exist."
+
+            triggers = self._get_triggers(source_columns.keys())
+            cursor.execute("SELECT name, sql FROM sqlite_master WHERE type='trigger'")
+            current_triggers = {x[0]: x[1] for x in cursor.fetchall()}
+
+            key_types = [source_columns.get(x, "") for x in self._key_columns]
+            value_types = [x.get_type(source_columns) for x in self.aggregates.values()] + ["INTEGER"]
+            columns = list(zip(self._key_columns + self._value_columns, key_types + value_types))
+
+            cursor.execute(f'''PRAGMA table_info("{self.name.strip("[]")}")''')
+            current_columns = [(x[1], x[2]) for x in cursor.fetchall()]
+
+            if (current_columns == columns
+                    and all(current_triggers.get(k) == v for k, v in triggers.items())):
+                cursor.execute('COMMIT')
+                return
+
+            for trigger_name in triggers:
+                cursor.execute(f'DROP TRIGGER IF EXISTS {trigger_name}')
+            cursor.execute(f'DROP TABLE IF EXISTS {self.name}')
+
+            key_definitions = [f'{x} {x_type}'.strip() for x, x_type in columns[:len(self._key_columns)]]
+            value_definitions = [f'{x} {x_type} NOT NULL DEFAULT 0'.replace("  ", " ") for x, x_type in columns[len(self._key_columns):]]
+            cursor.execute(f'''CREATE TABLE {self.name} ({", ".join(key_definitions + value_definitions)},
+                PRIMARY KEY ({", ".join(self._key_columns)}))''')
+            for command in triggers.values():
+                cursor.execute(command)
+
+            cursor.execute(self._rebuild_command())
+            cursor.execute('COMMIT')
+
+        except Exception as er:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            logging.exception(er)
+            raise
+
+        finally:
+            conn.close()
+
+    def _rebuild_command(self):
+        columns = ", ".join(self._key_columns + self._value_columns)
+        return f'INSERT INTO {self.name} ({columns}) {self._aggregate_select(self._source_table())}'
+
+    async def rebuild(self):
+        """Recomputes the whole view from the source table in one transaction."""
+        async with asqlite.connect(self.database_path, detect_types=constants.detect_types) as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(f'DELETE FROM {self.name}')
+                await cursor.execute(self._rebuild_command())
+
+            await conn.commit()
+
+    async def lag(self, tolerance: float=1e-9) -> int:
+        """
+            Returns the number of groups that differ from the source table, 0 means the view is fresh.
+            Values are compared with a relative tolerance of 'tolerance', since sums of REAL columns drift slightly under the incremental updates.
+            This scans the source table, use it for checks rather than reads.
+        """
+        live = self._aggregate_select(self._source_table())
+        same_key = " AND ".join([f's.{x}=l.{x}' for x in self._key_columns])
+        differs = " OR ".join([f'ABS(s.{x}-l.{x}) > {float(tolerance)!r}*MAX(1, ABS(l.{x}))' for x in self._value_columns])
+        command = (f'SELECT (SELECT COUNT(*) FROM {self.name} AS s LEFT JOIN ({live}) AS l ON {same_key} '
+                   f'WHERE l._count IS NULL OR {differs}) '
+                   f'+ (SELECT COUNT(*) FROM ({live}) AS l WHERE NOT EXISTS (SELECT 1 FROM {self.name} AS s WHERE {same_key}))')
+        async with asqlite.connect(self.database_path, detect_types=constants.detect_types) as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(command)
+                return (await cursor.fetchone())[0]
+
+    async def is_fresh(self, tolerance: float=1e-9) -> bool:
+        return await self.lag(tolerance) == 0
+
+    async def drop(self):
+        async with asqlite.connect(self.database_path, detect_types=constants.detect_types) as conn:
+            async with conn.cursor() as cursor:
+                for trigger_name in self._get_triggers([]):
+                    await cursor.execute(f'DROP TRIGGER IF EXISTS {trigger_name}')
+                await cursor.execute(f'DROP TABLE IF EXISTS {self.name}')
+
+            await conn.commit()
+
+    async def get_with(self, group_key, select_query: query.SelectQuery=None) -> t.Optional[sqlite3.Row]:
+        """'group_key' is the value, or list of values, of the GROUP BY columns."""
+        return await self.table.get_with(group_key, select_query)
+
+    async def get(self, select_query: query.SelectQuery) -> t.List[sqlite3.Row]:
+        return await self.table.get(select_query)
+
+    async def get_all(self) -> t.List[sqlite3.Row]:
+        return await self.table.get_all()
@@ -1,3 +1,3 @@
 from . import utils
 from .classes import *
-from .enums import OrderByType
\ No newline at end of file
+from .enums import OrderByType, JoinType
\ No newline at end of file
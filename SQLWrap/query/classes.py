@@ -1,7 +1,8 @@
+import copy
 import typing as t
 
 from . import utils
-from .enums import OrderByType
+from .enums import OrderByType, JoinType
 
 class OrderByColumn:
     def __init__(self, column: str, order_by: OrderByType = OrderByType.ASCENDING) -> None:
@@ -9,7 +10,7 @@ class OrderByColumn:
         self.order_by = order_by
 
 class SelectQuery(utils.HasWhereQueryBase):
-    def __init__(self, columns=None, limit=None, table=None, natural_join=None) -> None:
+    def __init__(self, columns=None, limit=None, table=None, natural_join=None, alias=None) -> None:
         super().__init__(table=table)
         self.columns = []
         if columns:
@@ -17,23 +18,44 @@ class SelectQuery(utils.HasWhereQueryBase):
             self.columns.extend(columns)
 
         self.limit = limit
+        self.alias = alias
         self._order_by: t.List[OrderByColumn] = None
         self._natural_join_with_table = natural_join
+        self._joins = []
+        self._group_by: t.List[str] = []
 
     def get_query(self):
         """Returns the query as (command, (params))."""
         params = []
         command = f'''SELECT {", ".join(self.columns) if len(self.columns) > 0 else "*"}'''
         command += f' FROM {self.table}'
+        if self.alias:
+            command += f' AS {self.alias}'
 
         if (self._natural_join_with_table):
             command += f' NATURAL JOIN {self._natural_join_with_table}'
 
+        for join_type, table, alias, on, on_params in self._joins:
+            if isinstance(table, SelectQuery):
+                sub_command, sub_params = table.get_query()
+                table = f'({sub_command})'
+                params.extend(sub_params)
+
+            command += f' {join_type.value} {table}'
+            if alias:
+                command += f' AS {alias}'
+            if on:
+                command += f' ON {on}'
+                params.extend(on_params)
+
         if (self._where):
             command += " WHERE " + self._where
             params.extend(self._where_params)
 
             command = command.strip()
+
+        if self._group_by:
+            command += f' GROUP BY {", ".join(self._group_by)}'
             
         if self._order_by:
             command += " ORDER BY "
@@ -53,10 +75,46 @@ class SelectQuery(utils.HasWhereQueryBase):
         # print((command, tuple(params)))
         return (command, tuple(params))
         
+    def copy(self):
+        """Returns a copy that can be changed without changing this query."""
+        select_query = copy.copy(self)
+        select_query.columns = list(self.columns)
+        select_query._where_params = list(self._where_params)
+        select_query._equals = {k: list(v) for k, v in self._equals.items()}
+        select_query._joins = list(self._joins)
+        select_query._group_by = list(self._group_by)
+        return select_query
+
     def specify_columns(self, *column_names):
         self.columns.extend(column_names)
         return self
 
+    def join(self, table, on=None, join_type: JoinType = JoinType.INNER, alias=None, on_params=()):
+        """
+            'table' is a table name or a SelectQuery, which needs an 'alias'.
+            'on' is either a condition string or a dictionary of {column: other_column} joined with AND.
+            'on_params' are the parameters for the '?' placeholders in a condition string.
+        """
+        if isinstance(on, dict):
+            on = " AND ".join([f'{k}={v}' for k, v in on.items()])
+
+        self._joins.append((join_type, table, alias, on, tuple(on_params)))
+        return self
+
+    def inner_join(self, table, on, alias=None, on_params=()):
+        return self.join(table, on, JoinType.INNER, alias=alias, on_params=on_params)
+
+    def left_join(self, table, on, alias=None, on_params=()):
+        return self.join(table, on, JoinType.LEFT, alias=alias, on_params=on_params)
+
+    def group_by(self, *column_names):
+        self._group_by.extend(column_names)
+        return self
+
+    def set_alias(self, alias: str):
+        self.alias = alias
+        return self
+
     def set_limit(self, limit: int):
         self.limit = limit
         return self
@@ -152,6 +210,7 @@ class SetQuery(UpdateQuery, InsertQuery):
         updateQuery = UpdateQuery(table=self.table, setDict=self._toSet)
         updateQuery._where = self._where
         updateQuery._where_params = self._where_params
+        updateQuery._equals = self._equals
 
         return updateQuery
 
@@ -2,4 +2,9 @@ from enum import Enum
 
 class OrderByType(Enum):
     ASCENDING = "ASC"
-    DESCENDING = "DESC"
\ No newline at end of file
+    DESCENDING = "DESC"
+
+class JoinType(Enum):
+    INNER = "INNER JOIN"
+    LEFT = "LEFT JOIN"
+    CROSS = "CROSS JOIN"
\ No newline at end of file
@@ -18,18 +18,27 @@ class HasWhereQueryBase(QueryBase):
         
         self._where = ""
         self._where_params = []
+        # Columns compared with '=' in this query, not in its subqueries, and their values. Used by check_where.
+        self._equals = {}
         
     #Not great but couldn't find a better way.
-    def add_where(self, *, equals=None, less=None, lessOrEquals=None, greater=None, greaterOrEquals=None, sep=" AND ", between=None, like=None, sep_from_before=" AND "):
+    def add_where(self, *, equals=None, less=None, lessOrEquals=None, greater=None, greaterOrEquals=None, sep=" AND ", between=None, like=None, sep_from_before=" AND ",
+                  is_in=None, not_in=None, equals_column=None, exists=None, not_exists=None):
         """
             'equals', 'less', 'lessOrEquals', 'greater', 'greaterOrEquals', 'like' are all dictionaries.
+            Their values can also be a SelectQuery, which is used as a subquery.
+            'is_in' and 'not_in' are dictionaries of {column: list or SelectQuery}.
+            'equals_column' is a dictionary of {column: other_column}, e.g. {"o.person_id": "p.id"} for correlated subqueries.
+            'exists' and 'not_exists' are a SelectQuery or a list of them.
             'sep' means separator between these statements.
             'between' is a tuple with the format (min, max, columnName).
             'sep_from_before' is the separator between these statement and others before.
+            Columns can be qualified with a table name or alias, e.g. "p.name".
+            Subqueries are rendered when they are added, so later changes to them are not seen.
 
             returns SelectQuery object.
         """
-        assert equals or less or lessOrEquals or greater or greaterOrEquals or between or like
+        assert equals or less or lessOrEquals or greater or greaterOrEquals or between or like or is_in or not_in or equals_column or exists or not_exists
 
         if self._where:
             self._where += sep_from_before
@@ -79,20 +88,96 @@ class HasWhereQueryBase(QueryBase):
             self._add_where(like, statement=" LIKE ", sep=sep)
             add_sep = True
 
+        if is_in:
+            if add_sep:
+                self._where += sep
+
+            self._add_where_in(is_in, statement=" IN ", sep=sep)
+            add_sep = True
+
+        if not_in:
+            if add_sep:
+                self._where += sep
+
+            self._add_where_in(not_in, statement=" NOT IN ", sep=sep)
+            add_sep = True
+
+        if equals_column:
+            if add_sep:
+                self._where += sep
+
+            self._where += sep.join([f'{k}={v}' for k, v in equals_column.items()])
+            add_sep = True
+
+        if exists:
+            if add_sep:
+                self._where += sep
+
+            self._add_where_exists(exists, statement="EXISTS ", sep=sep)
+            add_sep = True
+
+        if not_exists:
+            if add_sep:
+                self._where += sep
+
+            self._add_where_exists(not_exists, statement="NOT EXISTS ", sep=sep)
+            add_sep = True
+
         self._where +=")"
         return self
 
     def _add_where(self, dicti, statement, sep):
         for i, kandv in enumerate(dicti.items()):
             k, v = kandv
-            self._where += f'{k}{statement}?'
-            self._where_params.append(v)
+            if isinstance(v, QueryBase):
+                self._where += f'{k}{statement}{self._subquery(v)}'
+            else:
+                self._where += f'{k}{statement}?'
+                self._where_params.append(v)
+                if statement == "=":
+                    self._equals.setdefault(k, []).append(v)
 
             if (i != len(dicti)-1):
                 self._where += sep
 
+    def _add_where_in(self, dicti, statement, sep):
+        for i, kandv in enumerate(dicti.items()):
+            k, v = kandv
+            if isinstance(v, QueryBase):
+                self._where += f'{k}{statement}{self._subquery(v)}'
+            else:
+                v = list(v)
+                self._where += f'{k}{statement}({", ".join(["?"] * len(v))})'
+                self._where_params.extend(v)
+
+            if (i != len(dicti)-1):
+                self._where += sep
+
+    def _add_where_exists(self, queries, statement, sep):
+        if not isinstance(queries, list):
+            queries = [queries]
+
+        self._where += sep.join([f'{statement}{self._subquery(x)}' for x in queries])
+
+    def _subquery(self, query):
+        command, params = query.get_query()
+        self._where_params.extend(params)
+        return f'({command})'
+
+    def _add_raw_where(self, statement, params=(), sep_from_before=" AND ", wrap_existing=False):
+        """'wrap_existing' puts the current conditions in parentheses, so an " OR " among them can't bypass this one."""
+        if self._where:
+            if wrap_existing:
+                self._where = f"({self._where})"
+            self._where += sep_from_before
+
+        self._where += f"({statement})"
+        self._where_params.extend(params)
+        return self
+
     def check_where(self, key, value):
-        return key in self._where and value in self._where_params
+        """Checks if column 'key' is compared with '=' to 'value' in this query. Subqueries are not looked at."""
+        return value in self._equals.get(key, [])
         
 class HasToSetQueryBase(QueryBase):
     def __init__(self, table=None, setDict: dict=None) -> None: